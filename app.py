@@ -1,9 +1,21 @@
 # app.py
+import gzip
 import json
+import math
+import os
+import time
 from flask_cors import CORS  # This is the magic
 
-from flask import Flask, request, jsonify
-from engine.inference import Inference
+from flask import Flask, Response, abort, g, request, jsonify, send_from_directory
+from engine.logger.logger import Log
+from engine.registry import EngineRegistry
+from engine.util.admission import AdmissionController, Deadline, DeadlineExceeded, Overloaded
+from engine.util.capture import TrafficCapture
+from engine.util.constants import CAPTURE_FILE, CAPTURE_HEADERS, CAPTURE_PATHS, CAPTURE_SAMPLE_RATE, \
+    DEFAULT_KB, KB_DIRECTORY, KB_MEMORY_BUDGET, ADMISSION_DEADLINE, ADMISSION_DEGRADED_LIMIT, \
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, RESPONSE_GZIP_LEVEL, RESPONSE_GZIP_MIN_SIZE, \
+    PROFILE_DIRECTORY, PROFILE_KEEP, PROFILE_SAMPLE_RATE, PROFILE_TOKEN, USER_INPUT_SEP
+from engine.util.profiler import RequestProfiler
 
 app = Flask(__name__)
 CORS(app)  # This makes the CORS feature cover all routes in the app
@@ -11,8 +23,49 @@ CORS(app)  # This makes the CORS feature cover all routes in the app
 knowledgeBaseFile = "./data/knowledge.json"
 clauseBaseFile = "./data/clause.json"
 
-inferenceEngine = Inference()
-inferenceEngine.startEngine(knowledgeBaseFile)
+# keep the stdout writes off the request threads
+Log.configure(asynchronous=True)
+
+# engines of the Knowledge Bases served under /kb/<name>, the routes without
+# a name use the default one
+engineRegistry = EngineRegistry(KB_DIRECTORY, KB_MEMORY_BUDGET)
+engineRegistry.register(DEFAULT_KB, knowledgeBaseFile, clauseBaseFile)
+engineRegistry.getEngine(DEFAULT_KB)
+
+# bounds the inference requests running at once, see `resolve`
+admissionController = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE)
+
+# /think requests carrying the X-Profile token or sampled are profiled, the
+# profiler is not created at all when neither is set
+profileToken = os.environ.get("ES_PROFILE_TOKEN", PROFILE_TOKEN)
+profileSampleRate = float(os.environ.get("ES_PROFILE_SAMPLE_RATE", PROFILE_SAMPLE_RATE))
+requestProfiler = None
+if profileToken or profileSampleRate > 0:
+    requestProfiler = RequestProfiler(PROFILE_DIRECTORY, profileSampleRate, profileToken or None, PROFILE_KEEP)
+
+# sampled requests are appended to the capture file for `tools/replay.py`
+captureFile = os.environ.get("ES_CAPTURE_FILE", CAPTURE_FILE)
+trafficCapture = None
+if captureFile:
+    trafficCapture = TrafficCapture(captureFile, float(os.environ.get(
+        "ES_CAPTURE_SAMPLE_RATE", CAPTURE_SAMPLE_RATE)), CAPTURE_PATHS, CAPTURE_HEADERS)
+
+
+@app.before_request
+def start_capture():
+    if trafficCapture is not None and trafficCapture.sample(request.path):
+        g.captureStart = (time.time(), time.perf_counter())
+
+
+@app.after_request
+def end_capture(response):
+    captureStart = g.pop('captureStart', None)
+    if captureStart is not None:
+        started, counter = captureStart
+        path = request.full_path if request.query_string else request.path
+        trafficCapture.record(request.method, path, request.headers, request.get_json(silent=True),
+                              response.status_code, started, (time.perf_counter() - counter) * 1000)
+    return response
 
 
 @app.route('/')
@@ -20,38 +73,234 @@ def index():
     return "<a href=\"https://assignments-67f1e.web.app\">Enter the system</a>"
 
 
-@app.route('/clause', methods=['GET'])
-def clause():
+def get_files(name):
+    files = engineRegistry.getFiles(name)
+    if files is None:
+        abort(404)
+    return files
+
+
+def read_clause(name):
+    _, clauseFile = get_files(name)
+    if not os.path.isfile(clauseFile):
+        abort(404)
     file = None
-    with open(clauseBaseFile, "r") as file:
+    with open(clauseFile, "r") as file:
         file = json.load(file)
-    return jsonify(file)
+    if request.args.get('ids') != '1':
+        return jsonify(file)
 
+    # answer ids of the compiled vocabulary, to send to /think instead of the answers
+    inferenceEngine = engineRegistry.getEngine(name)
+    vocabulary = inferenceEngine.getVocabulary() if inferenceEngine is not None else None
+    if vocabulary is None:
+        abort(404)
+    for clause in (file.values() if isinstance(file, dict) else file):
+        clause['ids'] = {label: vocabulary.getId(answer) for label, answer in clause['answers'].items()}
+    response = jsonify(file)
+    response.headers['X-Vocabulary-Version'] = vocabulary.getVersion()
+    return response
 
-@app.route('/clause', methods=['PUT'])
-def update_clause():
-    data = request.get_json()
+
+def write_file(name, fileName, data):
+    os.makedirs(os.path.dirname(fileName) or ".", exist_ok=True)
     file = None
-    with open(clauseBaseFile, "w") as file:
+    with open(fileName, "w") as file:
         json.dump(data, file)
+    # the next request compiles the engine from the new files
+    engineRegistry.invalidate(name)
     return 'success'
 
 
+def get_deadline():
+    # the header can only shorten the configured deadline, None if it is invalid
+    if 'X-Deadline-Ms' not in request.headers:
+        return Deadline(ADMISSION_DEADLINE)
+    try:
+        seconds = float(request.headers['X-Deadline-Ms']) / 1000
+    except ValueError:
+        return None
+    if not math.isfinite(seconds) or seconds <= 0:
+        return None
+    return Deadline(min(seconds, ADMISSION_DEADLINE))
+
+
+def error_response(message, status):
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+
+def reject(message, status):
+    response = error_response(message, status)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def get_answers(data):
+    # answer ids as a list, or as a bitmask given as a number or a hex string
+    if 'ids' in data and 'mask' in data:
+        raise ValueError("Send either ids or mask")
+    if 'ids' in data:
+        answerIds = data['ids']
+        if not isinstance(answerIds, list) or any(type(answerId) is not int for answerId in answerIds):
+            raise ValueError("ids must be a list of integers")
+        return answerIds
+    mask = data['mask']
+    if isinstance(mask, str):
+        try:
+            mask = int(mask, 16)
+        except ValueError:
+            raise ValueError("mask must be an integer or a hex string")
+    if type(mask) is not int or mask < 0:
+        raise ValueError("mask must be an integer or a hex string")
+    return mask
+
+
+def respond(body):
+    # the body is encoded at once from the compiled fragments, only gzip is left
+    if len(body) >= RESPONSE_GZIP_MIN_SIZE and request.accept_encodings['gzip']:
+        response = Response(gzip.compress(body, RESPONSE_GZIP_LEVEL), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def resolve(name):
+    data = request.get_json()
+    inferenceEngine = engineRegistry.getEngine(name)
+    if inferenceEngine is None:
+        abort(404)
+
+    if not isinstance(data, dict):
+        return error_response("The body must be a JSON object", 400)
+    if 'm' not in data or 'v' not in data:
+        return error_response("m and v are required", 400)
+    answers = None
+    if 'ids' in data or 'mask' in data:
+        vocabulary = inferenceEngine.getVocabulary()
+        if vocabulary is None:
+            return error_response("The Knowledge Base has no answer ids", 400)
+        # ids are only valid for the vocabulary version they were served with
+        if 'ver' not in data:
+            return error_response("ver is required with ids or mask", 400)
+        if data['ver'] != vocabulary.getVersion():
+            return error_response("The answer ids are for another version", 409)
+        try:
+            answers = get_answers(data)
+        except ValueError as error:
+            return error_response(str(error), 400)
+    elif not isinstance(data.get('q'), str):
+        return error_response("q, ids or mask is required", 400)
+
+    if requestProfiler is not None and requestProfiler.sample(request.headers):
+        if answers is None:
+            answerCount = len(data['q'].split(USER_INPUT_SEP))
+        elif isinstance(answers, int):
+            answerCount = bin(answers).count('1')
+        else:
+            answerCount = len(answers)
+        tags = {"kb": name, "version": inferenceEngine.getVersion(), "method": data['m'],
+                "verbose": bool(data['v']), "fuzzy": bool(data.get('f', False)),
+                "ids": answers is not None, "answers": answerCount}
+        return requestProfiler.profile(lambda: infer(inferenceEngine, data, answers), tags,
+                                       request.headers.get('X-Profile-Allocations') == '1')
+    return infer(inferenceEngine, data, answers)
+
+
+def infer(inferenceEngine, data, answers):
+    deadline = get_deadline()
+    if deadline is None:
+        return error_response("X-Deadline-Ms must be a positive number", 400)
+    try:
+        with admissionController.admit(deadline):
+            # verbose requests only get the best targets while others are waiting
+            limit = None
+            if data['v'] and admissionController.underPressure():
+                admissionController.count("degraded")
+                limit = ADMISSION_DEGRADED_LIMIT
+            # the result is JSON encoded from the fragments compiled with the engine
+            if answers is not None:
+                result = inferenceEngine.inferenceResolveIds(
+                    answers, data['v'], data['m'], deadline, limit, encoded=True)
+            else:
+                result = inferenceEngine.inferenceResolve(
+                    data['q'], data['v'], data['m'], data.get('f', False), deadline, limit, encoded=True)
+    except Overloaded as error:
+        return reject(str(error), error.status)
+    except DeadlineExceeded as error:
+        admissionController.count("cancelled")
+        return reject(str(error), 503)
+    except ValueError as error:
+        # unknown answer ids
+        return error_response(str(error), 400)
+    return respond(result)
+
+
+@app.route('/clause', methods=['GET'])
+def clause():
+    return read_clause(DEFAULT_KB)
+
+
+@app.route('/clause', methods=['PUT'])
+def update_clause():
+    return write_file(DEFAULT_KB, get_files(DEFAULT_KB)[1], request.get_json())
+
+
 @app.route('/knowledge', methods=['PUT'])
 def update_knowledge():
-    data = request.get_json()
-    file = None
-    with open(knowledgeBaseFile, "w") as file:
-        json.dump(data, file)
-    return 'success'
+    return write_file(DEFAULT_KB, get_files(DEFAULT_KB)[0], request.get_json())
 
 
 @app.route('/think', methods=['POST'])
 def think():
-    data = request.get_json()
-    result = inferenceEngine.inferenceResolve(
-        data['q'], data['v'], data['m'])
-    return result
+    return resolve(DEFAULT_KB)
+
+
+@app.route('/kb/<name>/clause', methods=['GET'])
+def kb_clause(name):
+    return read_clause(name)
+
+
+@app.route('/kb/<name>/clause', methods=['PUT'])
+def kb_update_clause(name):
+    return write_file(name, get_files(name)[1], request.get_json())
+
+
+@app.route('/kb/<name>/knowledge', methods=['PUT'])
+def kb_update_knowledge(name):
+    return write_file(name, get_files(name)[0], request.get_json())
+
+
+@app.route('/kb/<name>/think', methods=['POST'])
+def kb_think(name):
+    return resolve(name)
+
+
+@app.route('/admission', methods=['GET'])
+def admission():
+    return jsonify(admissionController.getStats())
+
+
+@app.route('/profiles', methods=['GET'])
+def profiles():
+    if requestProfiler is None or not requestProfiler.authorized(request.headers):
+        abort(404)
+    return jsonify(requestProfiler.getProfiles())
+
+
+@app.route('/profiles/<profileId>', methods=['GET'])
+def profile_stats(profileId):
+    if requestProfiler is None or not requestProfiler.authorized(request.headers):
+        abort(404)
+    return send_from_directory(requestProfiler.getDirectory(), profileId + '.prof')
+
+
+@app.route('/kb', methods=['GET'])
+def kb_loaded():
+    return jsonify(engineRegistry.getLoaded())
 
 
 if __name__ == '__main__':
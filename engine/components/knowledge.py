@@ -30,8 +30,8 @@ class Rule:
 
     def __eq__(self, other):
         """
-        Comparison of two rules. Substring and more complex
-        comparison
+        Comparison of two rules by the exact rule string. Approximate
+        matching of the user answers is done by `RuleIndex`
 
         Parameters
         ----------
@@ -47,6 +47,17 @@ class Rule:
             return True
         return False
 
+    def __hash__(self):
+        """
+        Hash of the rule string, consistent with `__eq__`
+
+        Returns
+        -------
+        int
+            hash of the rule
+        """
+        return hash(self.__rule)
+
     def __str__(self):
         """
         Print the rule string
@@ -0,0 +1,215 @@
+"""
+Index over the rule strings of the Knowledge Base. Maps each rule to the
+targets using it and resolves free text answers to the closest rules by
+character n-gram similarity, without comparing the answer to every rule.
+"""
+
+import sys
+
+from engine.util.constants import DEADLINE_CHECK_INTERVAL, FUZZY_CACHE_SIZE, FUZZY_GRAM_SIZE, FUZZY_THRESHOLD
+
+
+class RuleIndex:
+    """
+    Postings built once from the Knowledge Base
+
+    Attributes
+    ----------
+    __targets : dict
+        rule string to the positions of the Knowledge objects using it, once per use
+    __exact : dict
+        normalized rule string to the rule strings with that form
+    __rules : list
+        normalized rule strings, the position is the rule id
+    __grams : list
+        number of n-grams of each rule id
+    __postings : dict
+        n-gram to the rule ids containing it
+    __resolved : dict
+        memoized answers resolved to rule strings
+    __indexSize : int
+        estimated bytes of the postings, measured once built
+    __resolvedSize : int
+        estimated bytes of the memoized answers
+
+    Examples
+    ---------
+    >>> index = RuleIndex(knowledgeBase)
+    >>> index.resolve("Feathers ")
+    frozenset({'feather'})
+    """
+
+    def __init__(self, knowledgeBase, threshold=FUZZY_THRESHOLD):
+        self.__threshold = threshold
+        self.__targets = dict()
+        self.__exact = dict()
+        self.__rules = list()
+        self.__grams = list()
+        self.__postings = dict()
+        self.__resolved = dict()
+        self.__resolvedSize = 0
+
+        for position, knowledge in enumerate(knowledgeBase):
+            for rule in knowledge.getRules():
+                self.__targets.setdefault(rule.getRule(), list()).append(position)
+
+        for rule in self.__targets:
+            normalized = RuleIndex.normalize(rule)
+            if normalized in self.__exact:
+                self.__exact[normalized].add(rule)
+                continue
+            self.__exact[normalized] = {rule}
+
+            ruleId = len(self.__rules)
+            grams = RuleIndex.grams(normalized)
+            self.__rules.append(normalized)
+            self.__grams.append(len(grams))
+            for gram in grams:
+                self.__postings.setdefault(gram, list()).append(ruleId)
+
+        self.__indexSize = sys.getsizeof(self.__targets) + sys.getsizeof(self.__exact) \
+            + sys.getsizeof(self.__rules) + sys.getsizeof(self.__grams) + sys.getsizeof(self.__postings)
+        for positions in self.__targets.values():
+            self.__indexSize += sys.getsizeof(positions)
+        for normalized, rules in self.__exact.items():
+            self.__indexSize += sys.getsizeof(normalized) + sys.getsizeof(rules)
+        for gram, ruleIds in self.__postings.items():
+            self.__indexSize += sys.getsizeof(gram) + sys.getsizeof(ruleIds)
+
+    @staticmethod
+    def normalize(text):
+        """
+        Lower case the text and collapse the whitespaces
+
+        Parameters
+        ----------
+        text : str
+            rule or answer
+
+        Returns
+        -------
+        str
+            normalized text
+        """
+        return " ".join(text.lower().split())
+
+    @staticmethod
+    def grams(text):
+        """
+        Character n-grams of the text padded with a space on both sides
+
+        Parameters
+        ----------
+        text : str
+            normalized text
+
+        Returns
+        -------
+        set
+            n-grams of the text
+        """
+        padded = f" {text} "
+        return {padded[i:i + FUZZY_GRAM_SIZE] for i in range(max(len(padded) - FUZZY_GRAM_SIZE + 1, 1))}
+
+    def getTargets(self, rule):
+        """
+        Get the Knowledge positions using the rule
+
+        Parameters
+        ----------
+        rule : str
+            rule string as in the Knowledge Base
+
+        Returns
+        -------
+        list
+            positions of the Knowledge objects, empty for an unknown rule
+        """
+        return self.__targets.get(rule, ())
+
+    def resolve(self, answer, deadline=None):
+        """
+        Resolve a user answer to the rule strings it matches. An answer equal to a
+        rule, ignoring case and spaces, only matches that rule. Otherwise the rules
+        sharing n-grams with it are scored by the Dice coefficient and the best ones
+        above the threshold are kept
+
+        Parameters
+        ----------
+        answer : str
+            answer given by the user
+        deadline : Deadline, default=None
+            checked while counting the shared n-grams
+
+        Returns
+        -------
+        frozenset
+            matched rule strings, empty if none is close enough
+        """
+        resolved = self.__resolved.get(answer)
+        if resolved is not None:
+            return resolved
+
+        normalized = RuleIndex.normalize(answer)
+        if normalized in self.__exact:
+            resolved = frozenset(self.__exact[normalized])
+        else:
+            resolved = self.__closest(normalized, deadline)
+
+        if len(self.__resolved) >= FUZZY_CACHE_SIZE:
+            self.__resolved.clear()
+            self.__resolvedSize = 0
+        self.__resolved[answer] = resolved
+        self.__resolvedSize += sys.getsizeof(answer) + sys.getsizeof(resolved)
+        return resolved
+
+    def estimateSize(self):
+        """
+        Estimate the memory taken by the index and the memoized answers
+
+        Returns
+        -------
+        int
+            estimated size in bytes
+        """
+        return self.__indexSize + sys.getsizeof(self.__resolved) + self.__resolvedSize
+
+    def __closest(self, normalized, deadline=None):
+        """
+        Find the rules with the highest n-gram similarity to the text
+
+        Parameters
+        ----------
+        normalized : str
+            normalized answer
+        deadline : Deadline, default=None
+            checked every `DEADLINE_CHECK_INTERVAL` postings
+
+        Returns
+        -------
+        frozenset
+            rule strings with the best similarity above the threshold
+        """
+        grams = RuleIndex.grams(normalized)
+        shared = dict()
+        for gram in grams:
+            ruleIds = self.__postings.get(gram, ())
+            for offset, ruleId in enumerate(ruleIds):
+                if deadline is not None and offset % DEADLINE_CHECK_INTERVAL == 0:
+                    deadline.check()
+                shared[ruleId] = shared.get(ruleId, 0) + 1
+
+        best = self.__threshold
+        closest = list()
+        for ruleId, count in shared.items():
+            similarity = 2 * count / (len(grams) + self.__grams[ruleId])
+            if similarity > best:
+                best = similarity
+                closest = [ruleId]
+            elif similarity == best:
+                closest.append(ruleId)
+
+        rules = set()
+        for ruleId in closest:
+            rules |= self.__exact[self.__rules[ruleId]]
+        return frozenset(rules)
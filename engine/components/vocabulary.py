@@ -0,0 +1,155 @@
+"""
+Compiled vocabulary of the clause answers. Each answer of the clause.json gets
+an integer id, so the user answers can be sent as ids or as a bitmask instead
+of the comma joined answer strings.
+"""
+
+import hashlib
+import sys
+
+from engine.util.constants import VOCABULARY_CACHE_SIZE
+
+
+class Vocabulary:
+    """
+    Answer ids are the positions of the distinct answers in the order of the
+    clause.json. They stay valid while the version does not change, the version
+    is derived from the answers and the version of the Knowledge Base.
+
+    Attributes
+    ----------
+    __answers : tuple
+        answer (rule string) of each id
+    __ids : dict
+        answer to its id
+    __version : str
+        version the ids are valid for
+    __masks : dict
+        memoized bitmasks decoded to answers
+    __masksSize : int
+        estimated bytes of the memoized bitmasks
+
+    Examples
+    ---------
+    >>> vocabulary = Vocabulary(clauseBase, knowledgeVersion)
+    >>> vocabulary.decode([0, 3])
+    frozenset({'flight', 'no feather'})
+    >>> vocabulary.decodeMask(0b1001)
+    frozenset({'flight', 'no feather'})
+    """
+
+    def __init__(self, clauseBase, knowledgeVersion):
+        answers = list()
+        self.__ids = dict()
+        for clause in clauseBase:
+            for answer in clause.getAnswers():
+                if answer not in self.__ids:
+                    self.__ids[answer] = len(answers)
+                    answers.append(answer)
+        self.__answers = tuple(answers)
+        self.__masks = dict()
+        self.__masksSize = 0
+
+        digest = hashlib.sha1(knowledgeVersion.encode())
+        for answer in self.__answers:
+            digest.update(b"\0" + answer.encode())
+        self.__version = digest.hexdigest()[:12]
+
+    def getVersion(self):
+        """
+        Get the version the ids are valid for
+
+        Returns
+        -------
+        str
+            short hash of the answers and the Knowledge Base version
+        """
+        return self.__version
+
+    def getId(self, answer):
+        """
+        Get the id of an answer
+
+        Parameters
+        ----------
+        answer : str
+            answer as in the clause.json
+
+        Returns
+        -------
+        int
+            id of the answer, None if it is not in the vocabulary
+        """
+        return self.__ids.get(answer)
+
+    def decode(self, answerIds):
+        """
+        Get the answers of a list of ids
+
+        Parameters
+        ----------
+        answerIds : list
+            ids of the answers
+
+        Returns
+        -------
+        frozenset
+            answers of the ids
+
+        Raises
+        ------
+        ValueError
+            if an id is not in the vocabulary
+        """
+        answers = set()
+        for answerId in answerIds:
+            if type(answerId) is not int or not 0 <= answerId < len(self.__answers):
+                raise ValueError(f"Unknown answer id {answerId!r}")
+            answers.add(self.__answers[answerId])
+        return frozenset(answers)
+
+    def decodeMask(self, mask):
+        """
+        Get the answers of a bitmask where bit i is set for the answer of id i
+
+        Parameters
+        ----------
+        mask : int
+            bitmask of the answers
+
+        Returns
+        -------
+        frozenset
+            answers of the set bits
+
+        Raises
+        ------
+        ValueError
+            if a bit past the last id is set
+        """
+        answers = self.__masks.get(mask)
+        if answers is not None:
+            return answers
+        if mask < 0 or mask >> len(self.__answers):
+            raise ValueError("Unknown answer id in mask " + hex(mask))
+
+        answers = frozenset(self.__answers[answerId] for answerId in range(mask.bit_length())
+                            if mask >> answerId & 1)
+        if len(self.__masks) >= VOCABULARY_CACHE_SIZE:
+            self.__masks.clear()
+            self.__masksSize = 0
+        self.__masks[mask] = answers
+        self.__masksSize += sys.getsizeof(mask) + sys.getsizeof(answers)
+        return answers
+
+    def estimateSize(self):
+        """
+        Estimate the memory taken by the ids and the memoized bitmasks
+
+        Returns
+        -------
+        int
+            estimated size in bytes
+        """
+        return sys.getsizeof(self.__answers) + sys.getsizeof(self.__ids) + sys.getsizeof(self.__masks) \
+            + self.__masksSize
@@ -3,14 +3,22 @@ Inference Engine to run the forward and backward chaining on the parsed
 KnowledgeBase and ClauseBase
 """
 
+import hashlib
 import os
 import secrets
+import sys
+import threading
+from collections import OrderedDict
 
-from engine.components.knowledge import Knowledge
+from engine.components.ruleIndex import RuleIndex
+from engine.components.vocabulary import Vocabulary
 from engine.logger.logger import Log
+from engine.parser.clauseParser import ClauseParser
 from engine.parser.knowledgeParser import KnowledgeBaseParser
-from engine.util.constants import USER_INPUT_SEP, AVATAR, PERCENT_MATCH
-from engine.util.utilities import sortDictionary
+from engine.util.encoder import ResultEncoder
+from engine.util.constants import USER_INPUT_SEP, AVATAR, PERCENT_MATCH, PROOF_CACHE_SIZE, \
+    DEADLINE_CHECK_INTERVAL
+from engine.util.utilities import sortDictionary, topDictionary
 
 
 class Inference:
@@ -24,14 +32,26 @@ class Inference:
         parser to parse the knowledge file into objects
     __knowledgeBase : list
         list of parsed Knowledge objects
-    __verbose : bool
-        to print the matched values percents
-    __method : str
-        values accepted
-
-            forward : run forward chaining
-            backward : run backward chaining
-
+    __targets : dict
+        Knowledge objects by target name, used to chain from a goal to its subgoals
+    __conditions : dict
+        rule strings of each target name
+    __subgoalsOf : dict
+        target name to the distinct targets named by its rules
+    __subgoals : set
+        targets named by the rule of another target, the only ones memoized
+    __ruleIndex : RuleIndex
+        targets of each rule and n-gram index for the fuzzy answers
+    __images : dict
+        image of each target name
+    __version : str
+        hash of the knowledge file the engine was compiled from
+    __vocabulary : Vocabulary
+        ids of the clause answers, None without a clause file
+    __encoder : ResultEncoder
+        JSON fragments of the targets for the encoded results
+    __proofTables : OrderedDict
+        memoized subgoal percents per set of user facts, least recently used first
     """
 
     def __init__(self):
@@ -39,12 +59,23 @@ class Inference:
         self.BACKWARD = "backward"
 
         self.__knowledgeParser = KnowledgeBaseParser()
+        self.__clauseParser = ClauseParser()
 
         self.__knowledgeBase = None
-        self.__verbose = None
-        self.__method = None
-
-    def startEngine(self, knowledgeBase, verbose=False, method="forward"):
+        self.__targets = None
+        self.__conditions = None
+        self.__subgoalsOf = None
+        self.__subgoals = None
+        self.__ruleIndex = None
+        self.__images = None
+        self.__encoder = None
+        self.__compiledSize = 0
+        self.__version = None
+        self.__vocabulary = None
+        self.__proofTables = OrderedDict()
+        self.__proofLock = threading.Lock()
+
+    def startEngine(self, knowledgeBase, clauseBase=None):
         """
         Read the files to parse and other options. Initialize the parsers and get the parsed values
 
@@ -52,10 +83,8 @@ class Inference:
         ----------
         knowledgeBase : str
             name and path of the file
-        verbose : bool, default=False
-            to print extra details
-        method : str, default="forward"
-            method to run on
+        clauseBase : str, default=None
+            name and path of the clause file to compile the answer ids from
 
         """
         if not os.path.isfile(knowledgeBase):
@@ -64,23 +93,158 @@ class Inference:
 
         self.__knowledgeBase = self.__knowledgeParser.getKnowledgeBase(
             knowledgeBase)
-        self.__verbose = verbose
-        self.__method = method
+        self.__targets = {knowledge.getTarget(): knowledge
+                          for knowledge in self.__knowledgeBase}
+        self.__conditions = {target: tuple(rule.getRule() for rule in knowledge.getRules())
+                             for target, knowledge in self.__targets.items()}
+        self.__subgoalsOf = {target: tuple(dict.fromkeys(condition for condition in conditions
+                                                         if condition in self.__targets))
+                             for target, conditions in self.__conditions.items()}
+        self.__subgoals = {subgoal for subgoals in self.__subgoalsOf.values() for subgoal in subgoals}
+        self.__ruleIndex = RuleIndex(self.__knowledgeBase)
+        self.__images = {knowledge.getTarget(): knowledge.getImage()
+                         for knowledge in self.__knowledgeBase}
+        self.__encoder = ResultEncoder(self.__knowledgeBase)
+        self.__compiledSize = self.__measureCompiled()
+        with open(knowledgeBase, "rb") as file:
+            self.__version = hashlib.sha1(file.read()).hexdigest()[:12]
+        if clauseBase is not None and os.path.isfile(clauseBase):
+            self.__vocabulary = Vocabulary(
+                self.__clauseParser.getClauseBase(clauseBase), self.__version)
+        with self.__proofLock:
+            self.__proofTables.clear()
+
+    def getVersion(self):
+        """
+        Get the version of the Knowledge Base, changing with the content of its file
+
+        Returns
+        -------
+        str
+            short hash of the knowledge file
+        """
+        return self.__version
+
+    def getVocabulary(self):
+        """
+        Get the ids of the clause answers
+
+        Returns
+        -------
+        Vocabulary
+            vocabulary of the clause file, None if the engine was started without one
+        """
+        return self.__vocabulary
+
+    def estimateSize(self):
+        """
+        Estimate the memory taken by the engine. The parsed Knowledge Base, the rule
+        index and the encoded fragments are measured at compile time, the memos
+        growing with the queries are measured on each call
+
+        Returns
+        -------
+        int
+            estimated size in bytes
+        """
+        size = self.__compiledSize + self.__ruleIndex.estimateSize()
+        if self.__vocabulary is not None:
+            size += self.__vocabulary.estimateSize()
+        with self.__proofLock:
+            for facts, table in self.__proofTables.items():
+                # the subgoal names are shared with the Knowledge Base, the percents are not
+                size += sys.getsizeof(facts) + sys.getsizeof(table) + len(table) * sys.getsizeof(0.0)
+        return size
+
+    def __measureCompiled(self):
+        """
+        Estimate the memory taken by the parsed Knowledge Base and the structures
+        compiled from it, other than the memos
+
+        Returns
+        -------
+        int
+            estimated size in bytes
+        """
+        size = sys.getsizeof(self.__knowledgeBase) + sys.getsizeof(self.__targets) \
+            + sys.getsizeof(self.__conditions) + sys.getsizeof(self.__subgoalsOf) \
+            + sys.getsizeof(self.__subgoals) + sys.getsizeof(self.__images) + self.__encoder.estimateSize()
+        for knowledge in self.__knowledgeBase:
+            size += sys.getsizeof(knowledge.getTarget()) + sys.getsizeof(knowledge.getImage()) \
+                + sys.getsizeof(knowledge.getRules()) + 2 * sys.getsizeof(knowledge)
+            for rule in knowledge.getRules():
+                # the rule object and its string
+                size += sys.getsizeof(rule) + sys.getsizeof(rule.getRule())
+        for target in self.__targets:
+            size += sys.getsizeof(self.__conditions[target]) + sys.getsizeof(self.__subgoalsOf[target])
+        return size
 
-    def inferenceResolve(self, userInput, verbose, method):
-        self.__verbose = verbose
-        self.__method = method
-        return self.__inferenceResolve(userInput)
+    def inferenceResolve(self, userInput, verbose, method, fuzzy=False, deadline=None, limit=None,
+                         encoded=False):
+        return self.__inferenceResolve(userInput, verbose, method, fuzzy, deadline, limit, encoded)
+
+    def inferenceResolveIds(self, answers, verbose, method, deadline=None, limit=None, encoded=False):
+        """
+        Run the inference on answer ids of the vocabulary, skipping the parsing of
+        the answer strings
+
+        Parameters
+        ----------
+        answers : list or int
+            list of answer ids, or bitmask with bit i set for the answer of id i
+        verbose : bool
+            return all targets with their percents instead of the best one
+        method : str
+            "forward" or "backward" chaining
+        deadline : Deadline, default=None
+            checked while scoring, raises `DeadlineExceeded` once it has passed
+        limit : int, default=None
+            most targets returned when verbose, all of them when None
+        encoded : bool, default=False
+            return the result as JSON bytes, see `ResultEncoder`
+
+        Returns
+        -------
+        dict or list
+            same result as `inferenceResolve`
+
+        Raises
+        ------
+        ValueError
+            if the engine has no vocabulary or an id is not in it
+        """
+        if self.__vocabulary is None:
+            raise ValueError("The Knowledge Base has no clause file to take answer ids from")
+        if type(answers) is int:
+            facts = self.__vocabulary.decodeMask(answers)
+        elif isinstance(answers, (list, tuple)):
+            facts = self.__vocabulary.decode(answers)
+        else:
+            raise ValueError("Answer ids must be a list or a bitmask")
+        return self.__runChain(facts, verbose, method, deadline, limit, encoded)
 
-    def __inferenceResolve(self, userInput):
+    def __inferenceResolve(self, userInput, verbose, method, fuzzy=False, deadline=None, limit=None,
+                           encoded=False):
         """
-        Run the inference on the user input for each clause. Method attribute determines
-        the method being used
+        Run the inference on the user input for each clause. The options are passed
+        per request, the engine is shared by the request threads
 
         Parameters
         ----------
         userInput : str
             input from the user
+        verbose : bool
+            return all targets with their percents instead of the best one
+        method : str
+            "forward" or "backward" chaining
+        fuzzy : bool, default=False
+            match each answer to the closest rules instead of the exact rule string
+        deadline : Deadline, default=None
+            checked while scoring, raises `DeadlineExceeded` once it has passed
+        limit : int, default=None
+            most targets returned when verbose, all of them when None
+        encoded : bool, default=False
+            return the result as JSON bytes, see `ResultEncoder`
 
         Returns
         -------
@@ -89,31 +253,48 @@ class Inference:
 
         """
         userInputs = userInput.split(USER_INPUT_SEP)
-        userKnowledge = Knowledge()
 
-        # creating a knowledge base of the user input
-        for userIn in userInputs:
-            userKnowledge.addRule("user", "", userIn.strip())
+        # creating the set of rules given by the user
+        if fuzzy:
+            facts = frozenset().union(
+                *(self.__ruleIndex.resolve(userIn, deadline) for userIn in userInputs))
+        else:
+            facts = frozenset(userIn.strip() for userIn in userInputs)
+
+        return self.__runChain(facts, verbose, method, deadline, limit, encoded)
 
+    def __runChain(self, facts: frozenset, verbose, method, deadline=None, limit=None, encoded=False):
+        """
+        Run the chaining selected by the method on the user rules
+        """
         # run inference with selected method
-        if self.__method == "forward":
-            return self.__runForwardChain(userKnowledge)
+        if method == "forward":
+            return self.__runForwardChain(facts, verbose, deadline, limit, encoded)
         else:
-            return self.__runBackwardChain(userKnowledge)
+            return self.__runBackwardChain(facts, verbose, deadline, limit, encoded)
 
-    def __runForwardChain(self, userBase: Knowledge):
+    def __runForwardChain(self, facts: frozenset, verbose, deadline=None, limit=None, encoded=False):
         """
         Running forward chaining.Steps are as follows :
 
-            1. Match each user rule with all the rules for each Knowledge target
+            1. Count the matches of each Knowledge target from the targets indexed
+               for each user rule
             2. Calculate the percentage for each target
             3. Return the output for the percent that satisfies the Min percent
             4. If verbose is True, print all matches with percentages
 
         Parameters
         ----------
-        userBase : Knowledge
-            Knowledge object created by parsing the user input
+        facts : frozenset
+            rule strings given by the user
+        verbose : bool
+            return all targets with their percents
+        deadline : Deadline, default=None
+            checked every `DEADLINE_CHECK_INTERVAL` targets
+        limit : int, default=None
+            most targets returned when verbose
+        encoded : bool, default=False
+            return the result as JSON bytes
 
         Returns
         -------
@@ -121,114 +302,290 @@ class Inference:
             bool : True denoting match found; str : formatted target name and percentage
         """
         matchesRules = dict()
-        matchesRulesImages = dict()
 
-        # getting each knowledge from the base
-        for knowledge in self.__knowledgeBase:
-            match = 0
+        # counting the matched rules of each knowledge from the index
+        matches = [0] * len(self.__knowledgeBase)
+        for fact in facts:
+            if deadline is not None:
+                deadline.check()
+            for position in self.__ruleIndex.getTargets(fact):
+                matches[position] += 1
 
-            # comparing each rule
-            for rule in knowledge.getRules():
-                for userRule in userBase.getRules():
-                    if rule == userRule:
-                        match += 1
+        # getting each knowledge from the base
+        for position, knowledge in enumerate(self.__knowledgeBase):
+            if deadline is not None and position % DEADLINE_CHECK_INTERVAL == 0:
+                deadline.check()
 
             # adding the percent of match for each target
             matchesRules[knowledge.getTarget()] = (
-                match / len(knowledge.getRules())) * 100
+                matches[position] / len(knowledge.getRules())) * 100
 
-            matchesRulesImages[knowledge.getTarget()
-                               ] = knowledge.getImage()
         # high percentage is returned based on satisfaction of MATCH
-        matchesRules = sortDictionary(matchesRules)
+        if deadline is not None:
+            deadline.check()
+        if not verbose:
+            matchesRules = topDictionary(matchesRules, 1)
+        elif limit is not None:
+            matchesRules = topDictionary(matchesRules, limit)
+        else:
+            matchesRules = sortDictionary(matchesRules)
 
-        if self.__verbose:
-            res = list()
-            sure = False
-            for target, percent in matchesRules.items():
-                if percent >= PERCENT_MATCH:
-                    sure = True
-                res.append({"target": target, "image": matchesRulesImages[target], "percent": percent})
-                Log.d(f"Target :: {target} --->  Matched :: {percent}")
-            print()
-            return {"image": self.makeImage(sure), "sure": sure, "value": res}
-
-        # returning the first match if it greater than the MIN
-        for target, percent in matchesRules.items():
-            if percent >= PERCENT_MATCH:
-                return {"image": self.makeImage(True), "sure": True, "value": [{"target": target, "image": matchesRulesImages[target], "percent": percent}]}
-            else:
-                return {"image": self.makeImage(False), "sure": False, "value": [{"target": target, "image": matchesRulesImages[target], "percent": percent}]}
-        return {"image": self.makeImage(False), "sure": False, "value": []}
+        return self.__makeResult(matchesRules, verbose, encoded, deadline)
 
-    def __runBackwardChain(self, userBase: Knowledge):
+    def __runBackwardChain(self, facts: frozenset, verbose, deadline=None, limit=None, encoded=False):
         """
-        Running forward chaining.Steps are as follows :
+        Running backward chaining. Steps are as follows :
 
-            1. Scan the Knowledge Base rules with the user rule
-            2. When match is found, save the Knowledge target as new target
-            3. Run match on the selected targets
-            4. Return the output based on the Min percent
+            1. Take every Knowledge target as a goal
+            2. A rule of the goal holds if it is a user rule, or if it names another
+               target (subgoal) that is itself proven by at least the Min percent
+            3. Subgoals naming each other in a cycle are proven together as the least
+               fixpoint, support only going round the cycle does not hold
+            4. Subgoal percents are memoized per set of user rules
+            5. Return the output based on the Min percent for goals with any support
 
         Parameters
         ----------
-        userBase : Knowledge
-            Knowledge object created by parsing the user input
+        facts : frozenset
+            rule strings given by the user
+        verbose : bool
+            return all targets with their percents
+        deadline : Deadline, default=None
+            checked every `DEADLINE_CHECK_INTERVAL` targets
+        limit : int, default=None
+            most targets returned when verbose
+        encoded : bool, default=False
+            return the result as JSON bytes
 
         Returns
         -------
         tuple
             bool : True denoting match found; str : formatted target name and percentage
         """
-        matchedTargets = list()
         matchesRules = dict()
-        matchesRulesImages = dict()
 
-        # finding initial target
-        for knowledge in self.__knowledgeBase:
-            for rule in knowledge.getRules():
-                for userRule in userBase.getRules():
-                    # rule match target acquired
-                    if rule == userRule:
-                        matchedTargets.append(knowledge)
-                        break
+        table = self.__getProofTable(facts)
+
+        for position, knowledge in enumerate(self.__knowledgeBase):
+            if deadline is not None and position % DEADLINE_CHECK_INTERVAL == 0:
+                deadline.check()
 
-        # running matching on the selected targets
-        for matchedTarget in matchedTargets:
-            match = 0
-            for rule in matchedTarget.getRules():
-                for userRule in userBase.getRules():
-                    if rule == userRule:
-                        match += 1
+            percent = self.__proveGoal(knowledge.getTarget(), facts, table, deadline)
 
-            # saving the target with its percent match
-            matchesRules[matchedTarget.getTarget()] = (
-                match / len(matchedTarget.getRules())) * 100
-            matchesRulesImages[matchedTarget.getTarget()
-                               ] = matchedTarget.getImage()
+            # only the goals supported by the user rules are reported
+            if percent > 0:
+                matchesRules[knowledge.getTarget()] = percent
 
         # sorting the matched rules by the percentages
-        matchesRules = sortDictionary(matchesRules)
+        if deadline is not None:
+            deadline.check()
+        if not verbose:
+            matchesRules = topDictionary(matchesRules, 1)
+        elif limit is not None:
+            matchesRules = topDictionary(matchesRules, limit)
+        else:
+            matchesRules = sortDictionary(matchesRules)
+
+        return self.__makeResult(matchesRules, verbose, encoded, deadline)
 
-        if self.__verbose:
-            res = list()
-            sure = False
+    def __makeResult(self, matchesRules, verbose, encoded, deadline=None):
+        """
+        Put together the result from the sorted percents, holding only the highest
+        one when not verbose
+
+        Parameters
+        ----------
+        matchesRules : dict
+            target name to its percent, sorted by the percents
+        verbose : bool
+            return all targets with their percents
+        encoded : bool
+            return the JSON encoded result as bytes instead of a dict
+        deadline : Deadline, default=None
+            checked before the result is put together
+
+        Returns
+        -------
+        dict or list
+            image, sure and the value list of target, image and percent
+        """
+        if verbose and Log.isEnabled('DEBUG'):
             for target, percent in matchesRules.items():
-                if percent >= PERCENT_MATCH:
-                    sure = True
-                res.append(
-                    {"target": target, "image": matchesRulesImages[target], "percent": percent})
-                Log.d(f"Target :: {target} --->  Matched :: {percent}")
-            print()
-            return {"image": self.makeImage(sure), "sure": sure, "value": res}
-
-        # returning the highest matches target if is greater than the MIN
-        for target, percent in matchesRules.items():
-            if percent >= PERCENT_MATCH:
-                return {"image": self.makeImage(True), "sure": True, "value": [{"target": target, "image": matchesRulesImages[target], "percent": percent}]}
+                Log.d("Target :: %s --->  Matched :: %s", target, percent)
+
+        # the first target is the highest match
+        sure = next(iter(matchesRules.values()), 0) >= PERCENT_MATCH
+        image = self.makeImage(sure)
+
+        if deadline is not None:
+            deadline.check()
+        if encoded:
+            return self.__encoder.encode(image, sure, matchesRules)
+        return {"image": image, "sure": sure,
+                "value": [{"target": target, "image": self.__images[target], "percent": percent}
+                          for target, percent in matchesRules.items()]}
+
+    def __getProofTable(self, facts: frozenset):
+        """
+        Get the memo table of proven subgoals for a set of user rules. Tables are shared
+        between queries with the same facts and the least recently used is dropped
+        once there are more than `PROOF_CACHE_SIZE`
+
+        Parameters
+        ----------
+        facts : frozenset
+            rule strings given by the user
+
+        Returns
+        -------
+        dict
+            subgoal name to its percent match
+        """
+        with self.__proofLock:
+            table = self.__proofTables.get(facts)
+            if table is None:
+                table = dict()
+                self.__proofTables[facts] = table
+                if len(self.__proofTables) > PROOF_CACHE_SIZE:
+                    self.__proofTables.popitem(last=False)
             else:
-                return {"image": self.makeImage(False), "sure": False, "value": [{"target": target, "image": matchesRulesImages[target], "percent": percent}]}
-        return {"image": self.makeImage(False), "sure": False, "value": []}
+                self.__proofTables.move_to_end(facts)
+            return table
+
+    def __proveGoal(self, goal, facts, table, deadline=None):
+        """
+        Prove a goal from the user rules, chaining back through the rules that
+        name other targets
+
+        Parameters
+        ----------
+        goal : str
+            name of the target to prove
+        facts : frozenset
+            rule strings given by the user
+        table : dict
+            memoized percents of the subgoals already proven for `facts`
+        deadline : Deadline, default=None
+            checked while proving the subgoals
+
+        Returns
+        -------
+        float
+            percent of the goal rules that hold
+        """
+        if goal in table:
+            return table[goal]
+        if goal in self.__subgoals:
+            self.__proveSubgoals(goal, facts, table, deadline)
+            return table[goal]
+
+        # only the subgoals are memoized, the other goals are proven once per query
+        for subgoal in self.__subgoalsOf[goal]:
+            if subgoal not in table:
+                self.__proveSubgoals(subgoal, facts, table, deadline)
+        return self.__percent(goal, facts, table, None)
+
+    def __proveSubgoals(self, root, facts, table, deadline=None):
+        """
+        Prove a subgoal and the subgoals it depends on, memoizing all of them. The
+        subgoal graph is walked with an explicit stack (Tarjan's strongly connected
+        components), each group of subgoals naming each other is solved as a fixpoint
+        once the groups it depends on are memoized
+
+        Parameters
+        ----------
+        root : str
+            name of the subgoal to prove
+        facts : frozenset
+            rule strings given by the user
+        table : dict
+            memoized percents of the subgoals, updated in place
+        deadline : Deadline, default=None
+            checked every `DEADLINE_CHECK_INTERVAL` subgoals walked and on each round
+            of a fixpoint
+        """
+        index = {root: 0}
+        low = {root: 0}
+        stack = [root]
+        onStack = {root}
+        work = [(root, iter(self.__subgoalsOf[root]))]
+
+        while work:
+            goal, subgoals = work[-1]
+            for subgoal in subgoals:
+                if subgoal in table:
+                    continue
+                if subgoal not in index:
+                    if deadline is not None and len(index) % DEADLINE_CHECK_INTERVAL == 0:
+                        deadline.check()
+                    index[subgoal] = low[subgoal] = len(index)
+                    stack.append(subgoal)
+                    onStack.add(subgoal)
+                    work.append((subgoal, iter(self.__subgoalsOf[subgoal])))
+                    break
+                if subgoal in onStack:
+                    low[goal] = min(low[goal], index[subgoal])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[goal])
+                if low[goal] != index[goal]:
+                    continue
+
+                # goal is the first of its group, the group is on top of the stack
+                component = dict()
+                while True:
+                    member = stack.pop()
+                    onStack.discard(member)
+                    component[member] = 0
+                    if member == goal:
+                        break
+
+                # percents only grow as more members hold, so this terminates
+                changed = True
+                while changed:
+                    if deadline is not None:
+                        deadline.check()
+                    changed = False
+                    for member in component:
+                        percent = self.__percent(member, facts, table, component)
+                        if percent != component[member]:
+                            component[member] = percent
+                            changed = True
+                table.update(component)
+
+    def __percent(self, goal, facts, table, component):
+        """
+        Percent of the rules of a goal that hold, its subgoals being already proven
+
+        Parameters
+        ----------
+        goal : str
+            name of the target
+        facts : frozenset
+            rule strings given by the user
+        table : dict
+            memoized percents of the subgoals
+        component : dict
+            percents of the subgoals being proven together, None if there are none
+
+        Returns
+        -------
+        float
+            percent of the goal rules that hold
+        """
+        conditions = self.__conditions[goal]
+        proven = 0
+        for condition in conditions:
+            if condition in facts:
+                proven += 1
+            elif component is not None and condition in component:
+                if component[condition] >= PERCENT_MATCH:
+                    proven += 1
+            elif table.get(condition, 0) >= PERCENT_MATCH:
+                proven += 1
+        return (proven / len(conditions)) * 100
 
     def makeImage(self, sure: bool):
         foundIt = ["https://media.giphy.com/media/IS9LfP9oSLdcY/giphy.gif",
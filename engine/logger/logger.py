@@ -2,8 +2,20 @@
 Main logger class to print to console based on the modes selected or passed. Utility modes support ASCII color formats.
 
 Android style logging system!
+
+Messages below the configured level are dropped before any formatting, so pass
+the values as arguments instead of an fstring on hot paths. Logs can be written
+by a background thread and as JSON lines, see `Log.configure`.
 """
 
+import json
+import random
+import sys
+import time
+
+from engine.util.constants import LOG_ASYNC, LOG_LEVEL, LOG_SAMPLE_RATE, LOG_STRUCTURED
+from engine.util.writer import BackgroundWriter
+
 
 class Log:
     """
@@ -16,12 +28,16 @@ class Log:
 
     {"mode" : "color"}
 
+    Log.levels : dict
+    storing mode string and its severity, modes below `Log.level` are not logged
+
     Examples
     ---------
     >>> Log.e("The input file does not exists")
     >>> Log.d("Loading the input data")
     >>> Log.w("Parsing with deprecated LParser")
     >>> Log.i("Parsing was successful")
+    >>> Log.d("Target :: %s --->  Matched :: %s", target, percent)
     """
     modes = dict()
     modes['DEBUG'] = '\033[92m'
@@ -29,8 +45,65 @@ class Log:
     modes['INFO'] = '\033[94m'
     modes['WARN'] = '\033[93m'
 
+    levels = dict()
+    levels['DEBUG'] = 10
+    levels['INFO'] = 20
+    levels['WARN'] = 30
+    levels['ERROR'] = 40
+
+    level = levels[LOG_LEVEL]
+    sampleRate = LOG_SAMPLE_RATE
+    structured = LOG_STRUCTURED
+    writer = BackgroundWriter(sys.stdout) if LOG_ASYNC else None
+
+    @staticmethod
+    def configure(level=None, asynchronous=None, structured=None, sampleRate=None):
+        """
+        Change how the messages are logged, options left as None are kept.
+
+        Parameters
+        ----------
+        level : str
+        lowest mode to log, one of the `Log.modes` keys
+        asynchronous : bool
+        write from a background thread instead of the calling thread
+        structured : bool
+        write JSON lines instead of colored text
+        sampleRate : float
+        fraction of the `DEBUG` and `INFO` messages to log, between 0 and 1
+        """
+        if level is not None:
+            Log.level = Log.levels[level]
+        if asynchronous is not None:
+            if asynchronous and Log.writer is None:
+                Log.writer = BackgroundWriter(sys.stdout)
+            elif not asynchronous and Log.writer is not None:
+                Log.writer.flush()
+                Log.writer = None
+        if structured is not None:
+            Log.structured = structured
+        if sampleRate is not None:
+            Log.sampleRate = sampleRate
+
+    @staticmethod
+    def isEnabled(mode):
+        """
+        Check if a mode is logged, to skip building expensive messages
+
+        Parameters
+        ----------
+        mode : str
+        mode to check
+
+        Returns
+        -------
+        bool
+            True if messages of the mode are logged
+        """
+        return Log.levels[mode] >= Log.level
+
     @staticmethod
-    def log(message, mode='INFO'):
+    def log(message, mode='INFO', args=()):
         """
         Logs input message with color defined by the mode and a tag of that mode.
 
@@ -45,11 +118,30 @@ class Log:
         'ERROR' : red color text with tag of [ERROR]
         'INFO' : blue color text with tag of [INFO]
         'WARN' : yellow color text with tag of [WARN]
+        args : tuple
+        values for the `%` placeholders of the message, only formatted
+        when the message is logged
         """
-        print(f"{Log.modes[mode]}[{mode}] {message}")
+        severity = Log.levels[mode]
+        if severity < Log.level:
+            return
+        if severity < Log.levels['WARN'] and Log.sampleRate < 1 and random.random() >= Log.sampleRate:
+            return
+
+        if args:
+            message = message % args
+        if Log.structured:
+            line = json.dumps({"time": time.time(), "level": mode, "message": str(message)})
+        else:
+            line = f"{Log.modes[mode]}[{mode}] {message}"
+
+        if Log.writer is not None:
+            Log.writer.write(line)
+        else:
+            print(line)
 
     @staticmethod
-    def d(message):
+    def d(message, *args):
         """
         Logs in debug mode, internally calls main log function which
         prints the message in `DEBUG` mode
@@ -59,11 +151,13 @@ class Log:
         message : str
         normal string to print function any fstring or
         format strings can be possible
+        args : any
+        values for the `%` placeholders of the message
         """
-        Log.log(message, mode='DEBUG')
+        Log.log(message, mode='DEBUG', args=args)
 
     @staticmethod
-    def i(message):
+    def i(message, *args):
         """
         Logs in info mode, internally calls main log function which
         prints the message in `INFO` mode
@@ -73,11 +167,13 @@ class Log:
         message : str
         normal string to print function any fstring or
         format strings can be possible
+        args : any
+        values for the `%` placeholders of the message
         """
-        Log.log(message, mode='INFO')
+        Log.log(message, mode='INFO', args=args)
 
     @staticmethod
-    def e(message):
+    def e(message, *args):
         """
         Logs in error mode, internally calls main log function which
         prints the message in `ERROR` mode
@@ -87,11 +183,13 @@ class Log:
         message : str
         normal string to print function any fstring
         or format strings can be possible
+        args : any
+        values for the `%` placeholders of the message
         """
-        Log.log(message, mode='ERROR')
+        Log.log(message, mode='ERROR', args=args)
 
     @staticmethod
-    def w(message):
+    def w(message, *args):
         """
         Logs in warning mode, internally calls main log function which
         prints the message in `WARN` mode
@@ -101,5 +199,7 @@ class Log:
         message : str
         normal string to print function any fstring or
         format strings can be possible
+        args : any
+        values for the `%` placeholders of the message
         """
-        Log.log(message, mode='WARN')
+        Log.log(message, mode='WARN', args=args)
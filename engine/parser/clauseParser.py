@@ -47,12 +47,15 @@ class ClauseParser:
         with open(inputFile, "r") as file:
             file = json.load(file)
 
+            # clauses are a list, or keyed by an id in older files
+            clauses = file.values() if isinstance(file, dict) else file
+
             # reading the que and ans, appending to a list
-            for clause in file:
+            for clause in clauses:
                 cl = Clause()
-                cl.addClause(clause=file[clause]['question'])
-                for answer in file[clause]['answers']:
-                    cl.addAnswer(file[clause]['answers'][answer])
+                cl.addClause(clause=clause['question'])
+                for answer in clause['answers']:
+                    cl.addAnswer(clause['answers'][answer])
                 self.__clauses.append(cl)
 
         return self.__clauses
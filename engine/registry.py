@@ -0,0 +1,198 @@
+"""
+Registry of the Inference engines of many Knowledge Bases, one per questionnaire.
+Engines are compiled on their first request and the least recently used are
+dropped to stay within a memory budget.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from engine.inference import Inference
+from engine.logger.logger import Log
+from engine.util.constants import KB_EVICT_CHECK_INTERVAL
+
+
+class EngineRegistry:
+    """
+    Knowledge Bases are named, the files of a name are `<directory>/<name>/knowledge.json`
+    and `<directory>/<name>/clause.json` unless registered with other files.
+
+    Attributes
+    ----------
+    __directory : str
+        directory holding a folder per Knowledge Base
+    __memoryBudget : int
+        estimated bytes the loaded engines can take
+    __files : dict
+        name to the knowledge and clause files registered outside the directory
+    __engines : OrderedDict
+        name to the loaded Inference, least recently used first
+    __lookups : int
+        engines served since the sizes were last checked, they grow with their memos
+    __loading : dict
+        name to the event set once its engine is compiled, so concurrent requests
+        wait for a single compilation
+    __stale : set
+        names invalidated while compiling, their engine is not kept
+
+    Examples
+    ---------
+    >>> registry = EngineRegistry("./data/kb", 64 * 1024 * 1024)
+    >>> registry.getEngine("birds").inferenceResolve("feather", False, "forward")
+    """
+
+    NAME = re.compile(r"[A-Za-z0-9_-]+")
+
+    def __init__(self, directory, memoryBudget):
+        self.__directory = directory
+        self.__memoryBudget = memoryBudget
+        self.__files = dict()
+        self.__engines = OrderedDict()
+        self.__lookups = 0
+        self.__loading = dict()
+        self.__stale = set()
+        self.__lock = threading.Lock()
+
+    def register(self, name, knowledgeFile, clauseFile):
+        """
+        Use files outside the directory for a Knowledge Base
+
+        Parameters
+        ----------
+        name : str
+            name of the Knowledge Base
+        knowledgeFile : str
+            name and path of the knowledge.json
+        clauseFile : str
+            name and path of the clause.json
+        """
+        self.__files[name] = (knowledgeFile, clauseFile)
+
+    def getFiles(self, name):
+        """
+        Get the files of a Knowledge Base, they may not exist yet
+
+        Parameters
+        ----------
+        name : str
+            name of the Knowledge Base
+
+        Returns
+        -------
+        tuple
+            knowledge file and clause file, None for an invalid name
+        """
+        if name in self.__files:
+            return self.__files[name]
+        if not EngineRegistry.NAME.fullmatch(name):
+            return None
+        folder = os.path.join(self.__directory, name)
+        return os.path.join(folder, "knowledge.json"), os.path.join(folder, "clause.json")
+
+    def getEngine(self, name):
+        """
+        Get the compiled engine of a Knowledge Base, compiling it on first use
+
+        Parameters
+        ----------
+        name : str
+            name of the Knowledge Base
+
+        Returns
+        -------
+        Inference
+            engine of the Knowledge Base, None if it does not exist
+        """
+        while True:
+            with self.__lock:
+                if name in self.__engines:
+                    self.__engines.move_to_end(name)
+                    self.__lookups += 1
+                    if self.__lookups >= KB_EVICT_CHECK_INTERVAL:
+                        self.__evict()
+                    return self.__engines[name]
+                loading = self.__loading.get(name)
+                if loading is None:
+                    loading = threading.Event()
+                    self.__loading[name] = loading
+                    break
+            # another request is compiling it, use its engine once done
+            loading.wait()
+
+        engine = None
+        try:
+            engine = self.__compile(name)
+        finally:
+            with self.__lock:
+                if engine is not None and name not in self.__stale:
+                    self.__engines[name] = engine
+                    self.__evict()
+                self.__stale.discard(name)
+                del self.__loading[name]
+            loading.set()
+        return engine
+
+    def invalidate(self, name):
+        """
+        Drop the engine of a Knowledge Base after its files changed, the next
+        request compiles it again
+
+        Parameters
+        ----------
+        name : str
+            name of the Knowledge Base
+        """
+        with self.__lock:
+            self.__engines.pop(name, None)
+            if name in self.__loading:
+                self.__stale.add(name)
+
+    def getLoaded(self):
+        """
+        Get the loaded Knowledge Bases
+
+        Returns
+        -------
+        dict
+            name to the estimated size of its engine, least recently used first
+        """
+        with self.__lock:
+            return {name: engine.estimateSize() for name, engine in self.__engines.items()}
+
+    def __compile(self, name):
+        """
+        Parse the files of a Knowledge Base into a new engine
+
+        Parameters
+        ----------
+        name : str
+            name of the Knowledge Base
+
+        Returns
+        -------
+        Inference
+            compiled engine, None if the knowledge file does not exist
+        """
+        files = self.getFiles(name)
+        if files is None or not os.path.isfile(files[0]):
+            return None
+        Log.i("Compiling the Knowledge Base %s", name)
+        engine = Inference()
+        engine.startEngine(files[0], clauseBase=files[1])
+        return engine
+
+    def __evict(self):
+        """
+        Drop the least recently used engines until the budget is met, the most
+        recently used is always kept. The sizes are measured again since the
+        memos of the engines grow with the queries
+        """
+        self.__lookups = 0
+        sizes = {name: engine.estimateSize() for name, engine in self.__engines.items()}
+        total = sum(sizes.values())
+        while total > self.__memoryBudget and len(self.__engines) > 1:
+            name, _ = self.__engines.popitem(last=False)
+            total -= sizes[name]
+            Log.i("Evicted the Knowledge Base %s", name)
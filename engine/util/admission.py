@@ -0,0 +1,207 @@
+"""
+Admission control in front of the inference. Bounds the requests running at
+once, rejects early the ones that cannot meet their deadline and lets the
+scoring loops give up once a deadline has passed.
+"""
+
+import threading
+import time
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised from the scoring loops once the deadline of the request has passed
+    """
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted
+
+    Attributes
+    ----------
+    status : int
+        HTTP status to answer with, 429 when the queue is full and 503 when
+        the deadline cannot be met
+    """
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class Deadline:
+    """
+    Time by which a request has to be answered
+
+    Examples
+    ---------
+    >>> deadline = Deadline(2.5)
+    >>> deadline.check()
+    """
+
+    def __init__(self, seconds):
+        self.__expiry = time.perf_counter() + seconds
+
+    def remaining(self):
+        """
+        Get the time left
+
+        Returns
+        -------
+        float
+            seconds left, negative once passed
+        """
+        return self.__expiry - time.perf_counter()
+
+    def check(self):
+        """
+        Cancel the work of the request once the deadline has passed
+        """
+        if time.perf_counter() >= self.__expiry:
+            raise DeadlineExceeded("The deadline of the request has passed")
+
+
+class AdmissionController:
+    """
+    Bounded number of requests in flight with a bounded queue in front. The
+    average service time is tracked to reject queued requests that would not
+    be answered in time anyway.
+
+    Attributes
+    ----------
+    __maxInFlight : int
+        requests running at once
+    __maxQueue : int
+        requests waiting for a slot
+    __serviceTime : float
+        moving average of the seconds taken by a request
+    __counters : dict
+        admitted, queued, rejected, cancelled and degraded requests
+
+    Examples
+    ---------
+    >>> controller = AdmissionController(8, 32)
+    >>> with controller.admit(Deadline(2.5)):
+    ...     result = engine.inferenceResolve(...)
+    """
+
+    def __init__(self, maxInFlight, maxQueue):
+        self.__maxInFlight = maxInFlight
+        self.__maxQueue = maxQueue
+        self.__inFlight = 0
+        self.__waiting = 0
+        self.__serviceTime = 0.0
+        self.__counters = dict.fromkeys(
+            ("admitted", "queued", "rejectedQueueFull", "rejectedDeadline", "cancelled", "degraded"), 0)
+        self.__condition = threading.Condition()
+
+    def admit(self, deadline):
+        """
+        Wait for a slot, to be used as a context manager around the request
+
+        Parameters
+        ----------
+        deadline : Deadline
+            deadline of the request
+
+        Returns
+        -------
+        _Admission
+            releases the slot on exit
+
+        Raises
+        ------
+        Overloaded
+            if the queue is full or the deadline cannot be met
+        """
+        with self.__condition:
+            if self.__inFlight >= self.__maxInFlight:
+                if self.__waiting >= self.__maxQueue:
+                    self.__counters["rejectedQueueFull"] += 1
+                    raise Overloaded("Too many requests waiting", 429)
+                self.__counters["queued"] += 1
+                self.__waiting += 1
+                try:
+                    while self.__inFlight >= self.__maxInFlight:
+                        remaining = deadline.remaining()
+                        if remaining <= self.__serviceTime:
+                            self.__counters["rejectedDeadline"] += 1
+                            raise Overloaded("The deadline cannot be met", 503)
+                        self.__condition.wait(remaining - self.__serviceTime)
+                finally:
+                    self.__waiting -= 1
+            elif deadline.remaining() <= 0:
+                self.__counters["rejectedDeadline"] += 1
+                raise Overloaded("The deadline cannot be met", 503)
+            self.__inFlight += 1
+            self.__counters["admitted"] += 1
+        return _Admission(self)
+
+    def underPressure(self):
+        """
+        Check if requests are waiting for a slot, to degrade the expensive ones
+
+        Returns
+        -------
+        bool
+            True if the queue is not empty
+        """
+        return self.__waiting > 0
+
+    def count(self, counter):
+        """
+        Increase a counter, "cancelled" or "degraded"
+
+        Parameters
+        ----------
+        counter : str
+            name of the counter
+        """
+        with self.__condition:
+            self.__counters[counter] += 1
+
+    def getStats(self):
+        """
+        Get the state and the counters
+
+        Returns
+        -------
+        dict
+            in flight and waiting requests, service time in milliseconds and counters
+        """
+        with self.__condition:
+            return dict(self.__counters, inFlight=self.__inFlight, waiting=self.__waiting,
+                        serviceTime=round(self.__serviceTime * 1000, 3))
+
+    def _release(self, seconds):
+        """
+        Free the slot of a finished request and update the service time
+
+        Parameters
+        ----------
+        seconds : float
+            time the request held the slot
+        """
+        with self.__condition:
+            self.__inFlight -= 1
+            self.__serviceTime += (seconds - self.__serviceTime) * 0.1
+            self.__condition.notify()
+
+
+class _Admission:
+    """
+    Slot held by an admitted request
+    """
+
+    def __init__(self, controller):
+        self.__controller = controller
+        self.__start = None
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.__controller._release(time.perf_counter() - self.__start)
+        return False
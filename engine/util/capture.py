@@ -0,0 +1,91 @@
+"""
+Capture of the served requests to a JSON lines file, to be replayed
+against a local server with `tools/replay.py`
+"""
+
+import json
+import random
+
+from engine.util.writer import BackgroundWriter
+
+
+class TrafficCapture:
+    """
+    Appends a sample of the requests with their timings to a file. The lines
+    are written by a background thread so the request is not held by the disk
+
+    Attributes
+    ----------
+    __sampleRate : float
+        fraction of the requests recorded, between 0 and 1
+    __paths : tuple
+        paths of the requests recorded
+    __headers : tuple
+        names of the request headers recorded when present
+    __writer : BackgroundWriter
+        writer of the capture file
+
+    Examples
+    ---------
+    >>> capture = TrafficCapture("capture.jsonl", 0.1, ("/think",))
+    >>> if capture.sample("/think"):
+    ...     capture.record("POST", "/think", headers, body, 200, time.time(), 3.2)
+    """
+
+    def __init__(self, captureFile, sampleRate, paths, headers):
+        self.__sampleRate = sampleRate
+        self.__paths = tuple(paths)
+        self.__headers = tuple(headers)
+        self.__writer = BackgroundWriter(open(captureFile, "a"))
+
+    def sample(self, path):
+        """
+        Decide if a request is recorded, before it is served
+
+        Parameters
+        ----------
+        path : str
+            path of the request
+
+        Returns
+        -------
+        bool
+            True if the request has to be recorded
+        """
+        if not path.startswith(self.__paths):
+            return False
+        return self.__sampleRate >= 1 or random.random() < self.__sampleRate
+
+    def record(self, method, path, headers, body, status, started, duration):
+        """
+        Queue a served request for writing
+
+        Parameters
+        ----------
+        method : str
+            HTTP method
+        path : str
+            path of the request with its query string
+        headers : dict
+            headers of the request, only the recorded ones are kept and X-Profile
+            is reduced to whether it was sent
+        body : any
+            parsed JSON body, None if there was no body
+        status : int
+            HTTP status of the response
+        started : float
+            epoch time the request was received
+        duration : float
+            time taken to serve the request in milliseconds
+        """
+        self.__writer.write(json.dumps({"time": started, "method": method, "path": path,
+                                        "headers": {name: headers[name] for name in self.__headers
+                                                    if name in headers},
+                                        "profiled": 'X-Profile' in headers,
+                                        "body": body, "status": status, "duration": duration}))
+
+    def flush(self):
+        """
+        Block until every recorded request is written
+        """
+        self.__writer.flush()
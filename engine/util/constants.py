@@ -1,8 +1,89 @@
 # percent to match with the rules, if matches the percent below it becomes TRUE
 PERCENT_MATCH = 60
 
+# number of user fact sets whose proven subgoals are kept for backward chaining
+PROOF_CACHE_SIZE = 256
+
+# lowest n-gram similarity (Dice coefficient) for a fuzzy answer to match a rule
+FUZZY_THRESHOLD = 0.6
+
+# length of the character n-grams indexed for fuzzy matching
+FUZZY_GRAM_SIZE = 3
+
+# number of fuzzy answers kept resolved before the memo is reset
+FUZZY_CACHE_SIZE = 4096
+
+# number of answer bitmasks kept decoded before the memo is reset
+VOCABULARY_CACHE_SIZE = 4096
+
 # when user answer some question the separator will be used
 USER_INPUT_SEP = ","
 
 # name of the expert system
 AVATAR = "Chankya"
+
+# lowest log mode printed : DEBUG, INFO, WARN or ERROR
+LOG_LEVEL = "DEBUG"
+
+# write the logs from a background thread instead of the request thread
+LOG_ASYNC = False
+
+# write the logs as JSON lines instead of colored text
+LOG_STRUCTURED = False
+
+# fraction of the DEBUG and INFO logs written
+LOG_SAMPLE_RATE = 1.0
+
+# file the requests are captured to for replay, None to disable the capture
+CAPTURE_FILE = None
+
+# fraction of the requests captured
+CAPTURE_SAMPLE_RATE = 1.0
+
+# paths of the captured requests
+CAPTURE_PATHS = ("/think", "/clause", "/knowledge", "/kb/")
+
+# request headers captured and replayed, they change the admission, encoding and profiling.
+# X-Profile is never kept, its token is a secret, the capture only says it was sent
+CAPTURE_HEADERS = ("X-Deadline-Ms", "Accept-Encoding", "X-Profile-Allocations")
+
+# directory with a folder of knowledge.json and clause.json per Knowledge Base
+KB_DIRECTORY = "./data/kb"
+
+# estimated bytes the loaded Knowledge Base engines can take before eviction
+KB_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# engines served between two checks of their sizes against the budget
+KB_EVICT_CHECK_INTERVAL = 64
+
+# Knowledge Base served by the routes without a name
+DEFAULT_KB = "default"
+
+# inference requests running at once, the others wait in the queue
+ADMISSION_MAX_IN_FLIGHT = 8
+
+# inference requests waiting for a slot before the new ones are rejected with 429
+ADMISSION_MAX_QUEUE = 64
+
+# seconds a request has to be answered in, the X-Deadline-Ms header can only shorten it
+ADMISSION_DEADLINE = 10.0
+
+# targets returned by the verbose requests when requests are waiting
+ADMISSION_DEGRADED_LIMIT = 20
+
+# targets scored between two deadline checks
+DEADLINE_CHECK_INTERVAL = 256
+
+# encoded /think responses from this size in bytes are gzipped when the client accepts it
+RESPONSE_GZIP_MIN_SIZE = 4 * 1024
+RESPONSE_GZIP_LEVEL = 5
+
+# directory of the request profiles and the number of them kept
+PROFILE_DIRECTORY = "./profiles"
+PROFILE_KEEP = 50
+
+# value of the X-Profile header asking for a profile, None to disable
+PROFILE_TOKEN = None
+
+# fraction of the /think requests profiled without the header
+PROFILE_SAMPLE_RATE = 0.0
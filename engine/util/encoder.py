@@ -0,0 +1,90 @@
+"""
+JSON encoding of the inference results from fragments prepared when the
+Knowledge Base is parsed. Only the percents are encoded per request.
+"""
+
+import json
+import sys
+
+
+class ResultEncoder:
+    """
+    Encoded JSON prefix of each target, holding its name and image. A result is
+    the concatenation of the fragments with the percents filled in, in the shape
+    of the dicts returned by `Inference.inferenceResolve`
+
+        {"image": ..., "sure": ..., "value": [{"target": ..., "image": ..., "percent": ...}]}
+
+    Attributes
+    ----------
+    __fragments : dict
+        target name to the encoded start of its value object
+
+    Examples
+    ---------
+    >>> encoder = ResultEncoder(knowledgeBase)
+    >>> encoder.encode(image, True, {"kiwi": 66.6})
+    """
+
+    def __init__(self, knowledgeBase):
+        self.__fragments = dict()
+        for knowledge in knowledgeBase:
+            self.__fragments[knowledge.getTarget()] = (
+                b'{"target":' + ResultEncoder.dumps(knowledge.getTarget())
+                + b',"image":' + ResultEncoder.dumps(knowledge.getImage()) + b',"percent":')
+
+    def estimateSize(self):
+        """
+        Estimate the memory taken by the fragments
+
+        Returns
+        -------
+        int
+            estimated size in bytes
+        """
+        return sys.getsizeof(self.__fragments) + sum(sys.getsizeof(fragment)
+                                                     for fragment in self.__fragments.values())
+
+    @staticmethod
+    def dumps(value):
+        """
+        Encode a value to compact JSON bytes
+
+        Parameters
+        ----------
+        value : any
+            value to encode
+
+        Returns
+        -------
+        bytes
+            encoded value
+        """
+        return json.dumps(value, separators=(",", ":")).encode()
+
+    def encode(self, image, sure, matchesRules):
+        """
+        Encode a result by joining the fragments of its targets
+
+        Parameters
+        ----------
+        image : str
+            image of the result
+        sure : bool
+            True if a target satisfies the Min percent
+        matchesRules : dict
+            target name to its percent, in the order returned
+
+        Returns
+        -------
+        bytes
+            JSON document
+        """
+        chunks = [b'{"image":' + ResultEncoder.dumps(image)
+                  + (b',"sure":true,"value":[' if sure else b',"sure":false,"value":[')]
+        separator = b""
+        for target, percent in matchesRules.items():
+            chunks.append(separator + self.__fragments[target] + repr(float(percent)).encode() + b"}")
+            separator = b","
+        chunks.append(b"]}")
+        return b"".join(chunks)
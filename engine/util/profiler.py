@@ -0,0 +1,191 @@
+"""
+On demand profiling of single requests. A request is profiled when it carries
+the profiling token or is sampled, the profile and a summary are written to a
+directory that only keeps the most recent ones.
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+
+
+class RequestProfiler:
+    """
+    Runs a request under cProfile, and tracemalloc if allocations are asked. Only
+    one request is profiled at a time, the others run as usual meanwhile.
+    tracemalloc traces every thread, so the allocations of concurrent requests
+    show up in the profile too.
+
+    Attributes
+    ----------
+    __directory : str
+        directory of the profiles
+    __sampleRate : float
+        fraction of the requests profiled without the token
+    __token : str
+        value of the `X-Profile` header asking for a profile, None to only sample
+    __keep : int
+        number of profiles kept in the directory
+
+    Examples
+    ---------
+    >>> profiler = RequestProfiler("./profiles", 0.0, "secret", 50)
+    >>> if profiler.sample(request.headers):
+    ...     response = profiler.profile(handle, {"kb": "default"})
+    """
+
+    def __init__(self, directory, sampleRate, token, keep):
+        self.__directory = directory
+        self.__sampleRate = sampleRate
+        self.__token = token
+        self.__keep = keep
+        self.__lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def authorized(self, headers):
+        """
+        Check if the request carries the profiling token
+
+        Parameters
+        ----------
+        headers : dict
+            headers of the request
+
+        Returns
+        -------
+        bool
+            True if the `X-Profile` header matches the token
+        """
+        return self.__token is not None and hmac.compare_digest(
+            headers.get('X-Profile', '').encode('utf-8'), self.__token.encode('utf-8'))
+
+    def sample(self, headers):
+        """
+        Decide if a request is profiled
+
+        Parameters
+        ----------
+        headers : dict
+            headers of the request
+
+        Returns
+        -------
+        bool
+            True if the request carries the token or is sampled
+        """
+        return self.authorized(headers) or (self.__sampleRate > 0 and random.random() < self.__sampleRate)
+
+    def profile(self, handle, tags, allocations=False):
+        """
+        Run a request under the profiler and write its profile
+
+        Parameters
+        ----------
+        handle : function
+            serves the request, called without arguments
+        tags : dict
+            Knowledge Base version, query shape and other values to find the profile by
+        allocations : bool, default=False
+            also trace the memory allocations
+
+        Returns
+        -------
+        any
+            value returned by `handle`
+        """
+        if not self.__lock.acquire(blocking=False):
+            return handle()
+        try:
+            profiler = cProfile.Profile()
+            if allocations:
+                tracemalloc.start()
+            started = time.time()
+            counter = time.perf_counter()
+            profiler.enable()
+            try:
+                return handle()
+            finally:
+                profiler.disable()
+                duration = (time.perf_counter() - counter) * 1000
+                snapshot = None
+                if allocations:
+                    snapshot = tracemalloc.take_snapshot()
+                    tracemalloc.stop()
+                self.__write(profiler, snapshot, tags, started, duration)
+        finally:
+            self.__lock.release()
+
+    def getProfiles(self):
+        """
+        Get the summaries of the kept profiles
+
+        Returns
+        -------
+        list
+            summaries, the most recent first
+        """
+        profiles = list()
+        for fileName in sorted(os.listdir(self.__directory), reverse=True):
+            if not fileName.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.__directory, fileName), "r") as file:
+                    profiles.append(json.load(file))
+            except (OSError, ValueError):
+                # removed by the rotation while listing
+                continue
+        return profiles
+
+    def getDirectory(self):
+        """
+        Get the directory of the profiles
+
+        Returns
+        -------
+        str
+            directory of the profiles
+        """
+        return self.__directory
+
+    def __write(self, profiler, snapshot, tags, started, duration):
+        """
+        Write the cProfile stats and a JSON summary, then drop the oldest profiles
+        """
+        # names sort by time so the rotation and the listing need no stat calls
+        profileId = (time.strftime("%Y%m%d%H%M%S", time.gmtime(started))
+                     + f"{int(started * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}")
+        profileFile = os.path.join(self.__directory, profileId + ".prof")
+        profiler.dump_stats(profileFile)
+
+        stats = pstats.Stats(profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:20]
+        summary = {
+            "id": profileId,
+            "time": started,
+            "duration": round(duration, 3),
+            "tags": tags,
+            "functions": [{"function": f"{fileName}:{line}({name})", "calls": calls,
+                           "own": round(own * 1000, 3), "cumulative": round(cumulative * 1000, 3)}
+                          for (fileName, line, name), (_, calls, own, cumulative, _) in functions],
+        }
+        if snapshot is not None:
+            summary["allocations"] = [{"line": str(stat.traceback), "size": stat.size, "count": stat.count}
+                                      for stat in snapshot.statistics("lineno")[:20]]
+        with open(os.path.join(self.__directory, profileId + ".json"), "w") as file:
+            json.dump(summary, file)
+
+        profileIds = sorted(fileName[:-5] for fileName in os.listdir(self.__directory)
+                            if fileName.endswith(".json"))
+        for oldId in profileIds[:-self.__keep]:
+            for extension in (".json", ".prof"):
+                try:
+                    os.remove(os.path.join(self.__directory, oldId + extension))
+                except OSError:
+                    pass
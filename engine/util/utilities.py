@@ -1,3 +1,6 @@
+import heapq
+
+
 def sortDictionary(matchesRules):
     """
     sort the dictionary by the values
@@ -13,3 +16,22 @@ def sortDictionary(matchesRules):
         sorted by values dictionary
     """
     return {key: value for key, value in sorted(matchesRules.items(), key=lambda item: item[1], reverse=True)}
+
+
+def topDictionary(matchesRules, limit):
+    """
+    keep the entries with the highest values, sorted by the values
+
+    Parameters
+    ----------
+    matchesRules : dict
+        input dictionary
+    limit : int
+        number of entries kept
+
+    Returns
+    -------
+    dict
+        the `limit` highest entries sorted by values
+    """
+    return {key: value for key, value in heapq.nlargest(limit, matchesRules.items(), key=lambda item: item[1])}
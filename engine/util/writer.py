@@ -0,0 +1,91 @@
+"""
+Background writer to move blocking stream writes off the request thread.
+Lines are queued by the caller and written by a daemon thread.
+"""
+
+import atexit
+import queue
+import threading
+
+
+class BackgroundWriter:
+    """
+    Queue backed writer for a text stream. Writing never blocks the caller,
+    lines that do not fit in the queue are dropped and counted
+
+    Attributes
+    ----------
+    __stream : file object
+        stream the lines are written to
+    __queue : queue.Queue
+        lines waiting to be written
+    __dropped : int
+        number of lines dropped because the queue was full
+
+    Examples
+    ---------
+    >>> writer = BackgroundWriter(sys.stdout)
+    >>> writer.write("Loading the input data")
+    """
+
+    def __init__(self, stream, maxQueue=10000):
+        self.__stream = stream
+        self.__queue = queue.Queue(maxsize=maxQueue)
+        self.__dropped = 0
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        atexit.register(self.flush)
+
+    def write(self, line):
+        """
+        Queue a line for writing, a new line is added by the writer
+
+        Parameters
+        ----------
+        line : str
+            line to write
+
+        Returns
+        -------
+        bool
+            False if the line was dropped
+        """
+        try:
+            self.__queue.put_nowait(line)
+        except queue.Full:
+            self.__dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """
+        Block until every queued line is written to the stream
+        """
+        self.__queue.join()
+
+    def getDropped(self):
+        """
+        Get the number of dropped lines
+
+        Returns
+        -------
+        int
+            lines dropped since the writer started
+        """
+        return self.__dropped
+
+    def __run(self):
+        """
+        Write the queued lines, flushing the stream once the queue is drained
+        """
+        while True:
+            line = self.__queue.get()
+            try:
+                self.__stream.write(line + "\n")
+                if self.__queue.empty():
+                    self.__stream.flush()
+            except (OSError, ValueError):
+                # stream closed or broken, keep draining so flush() returns
+                pass
+            finally:
+                self.__queue.task_done()
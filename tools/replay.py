@@ -0,0 +1,224 @@
+"""
+Replay the requests captured by `app.py` against a local server and report
+the throughput, latency percentiles and error rates.
+
+    open loop : requests are sent at the recorded times divided by the speed,
+                whether or not the earlier ones are answered
+    closed loop : a fixed number of clients send the requests back to back
+
+Examples
+---------
+    python tools/replay.py capture.jsonl --speed 4
+    python tools/replay.py capture.jsonl --mode closed --clients 16
+    python tools/replay.py capture.jsonl --profile-token "$ES_PROFILE_TOKEN"
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def loadCapture(captureFile, writes):
+    """
+    Read the captured requests in the order they were received
+
+    Parameters
+    ----------
+    captureFile : str
+        name and path of the capture file
+    writes : bool
+        keep the PUT requests, they overwrite the files of the server
+
+    Returns
+    -------
+    list
+        captured requests as dicts
+    """
+    captured = list()
+    with open(captureFile, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['method'] == 'PUT' and not writes:
+                continue
+            captured.append(record)
+    captured.sort(key=lambda record: record['time'])
+    return captured
+
+
+def send(url, record, timeout, profileToken=None):
+    """
+    Send one captured request
+
+    Parameters
+    ----------
+    url : str
+        base url of the server
+    record : dict
+        captured request
+    timeout : float
+        seconds to wait for the response
+    profileToken : str
+        X-Profile token sent with the requests profiled when captured, None to send none
+
+    Returns
+    -------
+    int
+        HTTP status, 0 if no response was received
+    """
+    data = None
+    # captures older than the header recording have none
+    headers = dict(record.get('headers', {}))
+    # older captures kept the X-Profile token itself, it is never forwarded
+    headers.pop('X-Profile', None)
+    if record.get('profiled') and profileToken is not None:
+        headers['X-Profile'] = profileToken
+    if record['body'] is not None:
+        data = json.dumps(record['body']).encode()
+        headers['Content-Type'] = 'application/json'
+    req = urllib.request.Request(url + record['path'], data=data, headers=headers,
+                                 method=record['method'])
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+
+def runOpenLoop(url, captured, speed, timeout, profileToken=None):
+    """
+    Send each request at its recorded offset divided by the speed. The latency is
+    measured from the scheduled time, so a slow server is not hidden by late sends
+
+    Returns
+    -------
+    list
+        tuple of status and latency in milliseconds for each request
+    """
+    results = list()
+    lock = threading.Lock()
+
+    def timed(record, scheduled):
+        status = send(url, record, timeout, profileToken)
+        with lock:
+            results.append((status, (time.perf_counter() - scheduled) * 1000))
+
+    first = captured[0]['time']
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=256) as pool:
+        for record in captured:
+            scheduled = start + (record['time'] - first) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(timed, record, scheduled)
+    return results
+
+
+def runClosedLoop(url, captured, clients, timeout, profileToken=None):
+    """
+    Send the requests from a fixed number of clients, each sending its next request
+    once the previous one is answered
+
+    Returns
+    -------
+    list
+        tuple of status and latency in milliseconds for each request
+    """
+    def timed(record):
+        started = time.perf_counter()
+        status = send(url, record, timeout, profileToken)
+        return status, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return list(pool.map(timed, captured))
+
+
+def percentile(values, percent):
+    """
+    Nearest rank percentile of sorted values
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, math.ceil(percent / 100 * len(values)) - 1))]
+
+
+def report(results, elapsed):
+    """
+    Summarize the replay
+
+    Parameters
+    ----------
+    results : list
+        tuple of status and latency in milliseconds for each request
+    elapsed : float
+        seconds taken by the replay
+
+    Returns
+    -------
+    dict
+        throughput, latency percentiles and errors
+    """
+    latencies = sorted(latency for _, latency in results)
+    statuses = dict()
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(1 for status, _ in results if status == 0 or status >= 400)
+    return {
+        "requests": len(results),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(results) / elapsed, 2) if elapsed else 0,
+        "latency": {f"p{percent}": round(percentile(latencies, percent), 2)
+                    for percent in (50, 90, 95, 99)} | {"max": round(latencies[-1], 2) if latencies else 0},
+        "errorRate": round(errors / len(results), 4) if results else 0,
+        "statuses": statuses,
+    }
+
+
+def main():
+    argParser = argparse.ArgumentParser(description="Replay captured requests against a server")
+    argParser.add_argument("capture", help="capture file written by app.py")
+    argParser.add_argument("--url", default="http://127.0.0.1:5000", help="base url of the server")
+    argParser.add_argument("--mode", choices=("open", "closed"), default="open")
+    argParser.add_argument("--speed", type=float, default=1.0,
+                           help="open loop rate multiplier of the recorded rate")
+    argParser.add_argument("--clients", type=int, default=8, help="closed loop clients")
+    argParser.add_argument("--repeat", type=int, default=1, help="times the capture is replayed")
+    argParser.add_argument("--timeout", type=float, default=30.0, help="seconds per request")
+    argParser.add_argument("--writes", action="store_true", help="also replay the PUT requests")
+    argParser.add_argument("--profile-token", default=os.environ.get("ES_PROFILE_TOKEN"),
+                           help="X-Profile token for the requests profiled when captured, "
+                                "defaults to ES_PROFILE_TOKEN")
+    args = argParser.parse_args()
+
+    captured = loadCapture(args.capture, args.writes)
+    if not captured:
+        print(json.dumps({"requests": 0}))
+        return
+
+    # repeated passes follow each other on the recorded timeline
+    span = captured[-1]['time'] - captured[0]['time'] + 1
+    captured = [dict(record, time=record['time'] + span * i)
+                for i in range(args.repeat) for record in captured]
+
+    start = time.perf_counter()
+    if args.mode == "open":
+        results = runOpenLoop(args.url, captured, args.speed, args.timeout, args.profile_token)
+    else:
+        results = runClosedLoop(args.url, captured, args.clients, args.timeout,
+                                args.profile_token)
+    print(json.dumps(report(results, time.perf_counter() - start), indent=2))
+
+
+if __name__ == '__main__':
+    main()